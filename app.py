@@ -27,6 +27,26 @@ app.config['CACHE_FOLDER'] = 'cache'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 
+# Face quality filtering applied between detection and embedding.
+# 'skip' drops faces failing any threshold before the FaceNet pass,
+# 'score' keeps every face. In both modes the quality is stored with the
+# embedding, can be filtered on at search time, and down-ranks matches
+# by FACE_QUALITY_WEIGHT.
+app.config['FACE_QUALITY_MODE'] = os.environ.get('FACE_QUALITY_MODE', 'skip')
+app.config['FACE_MIN_SIZE'] = int(os.environ.get('FACE_MIN_SIZE', 40))  # px, shorter box side
+app.config['FACE_GOOD_SIZE'] = int(os.environ.get('FACE_GOOD_SIZE', 112))  # px, full size score
+app.config['FACE_MIN_SHARPNESS'] = float(os.environ.get('FACE_MIN_SHARPNESS', 40.0))  # Laplacian variance
+app.config['FACE_GOOD_SHARPNESS'] = float(os.environ.get('FACE_GOOD_SHARPNESS', 200.0))
+app.config['FACE_MAX_YAW'] = float(os.environ.get('FACE_MAX_YAW', 0.3))  # nose offset along eye line / eye distance, 0 frontal to ~0.5 profile
+app.config['FACE_MAX_ROLL'] = float(os.environ.get('FACE_MAX_ROLL', 35.0))  # degrees
+app.config['FACE_MIN_QUALITY'] = float(os.environ.get('FACE_MIN_QUALITY', 0.3))  # combined score, 0-1
+app.config['FACE_QUALITY_WEIGHT'] = float(os.environ.get('FACE_QUALITY_WEIGHT', 0.2))  # share of match rank from quality
+app.config['FACE_QUALITY_CROP'] = 160  # sharpness is measured at FaceNet input size
+
+if app.config['FACE_QUALITY_MODE'] not in ('skip', 'score'):
+    print(f"Invalid FACE_QUALITY_MODE '{app.config['FACE_QUALITY_MODE']}', falling back to 'skip'")
+    app.config['FACE_QUALITY_MODE'] = 'skip'
+
 # Configure CORS for frontend
 CORS(app, supports_credentials=True)
 
@@ -102,15 +122,77 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super(NumpyEncoder, self).default(obj)
 
-def extract_faces(img_array, confidence_threshold=0.8):
-    """Extract faces from image with error handling"""
+def assess_face_quality(rgb_img, box, keypoints):
+    """Score a detected face on size, sharpness and pose (0-1 each)"""
+    x1, y1, x2, y2 = box
+    side = min(x2 - x1, y2 - y1)
+    size_score = float(np.clip(side / app.config['FACE_GOOD_SIZE'], 0.0, 1.0))
+
+    # Sharpness: variance of the Laplacian on the grayscale crop, resized to a
+    # fixed size so the thresholds mean the same thing for every face size
+    gray = cv2.cvtColor(rgb_img[y1:y2, x1:x2], cv2.COLOR_RGB2GRAY)
+    sharpness = 0.0
+    if gray.size > 0:
+        crop_size = app.config['FACE_QUALITY_CROP']
+        gray = cv2.resize(gray, (crop_size, crop_size), interpolation=cv2.INTER_AREA)
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    sharpness_score = float(np.clip(sharpness / app.config['FACE_GOOD_SHARPNESS'], 0.0, 1.0))
+
+    # Pose from MTCNN landmarks: yaw from the nose offset against the eye
+    # midpoint along the eye line (so roll isn't counted as yaw), roll from
+    # the angle of the eye line
+    yaw, roll = 0.0, 0.0
+    pose_score = 1.0
+    if keypoints and all(k in keypoints for k in ('left_eye', 'right_eye', 'nose')):
+        (lx, ly), (rx, ry) = keypoints['left_eye'], keypoints['right_eye']
+        nx, ny = keypoints['nose']
+        mx, my = (lx + rx) / 2.0, (ly + ry) / 2.0
+        eye_dist = float(np.hypot(rx - lx, ry - ly))
+        if eye_dist > 0:
+            yaw = abs((nx - mx) * (rx - lx) + (ny - my) * (ry - ly)) / eye_dist ** 2
+            roll = abs(float(np.degrees(np.arctan2(ry - ly, rx - lx))))
+            yaw_score = 1.0 - min(yaw / app.config['FACE_MAX_YAW'], 1.0)
+            roll_score = 1.0 - min(roll / app.config['FACE_MAX_ROLL'], 1.0)
+            pose_score = float(min(yaw_score, roll_score))
+        else:
+            # Degenerate landmarks: treat the pose as unusable
+            yaw, roll = float('inf'), float('inf')
+            pose_score = 0.0
+
+    return {
+        'score': round((size_score + sharpness_score + pose_score) / 3.0, 4),
+        'size': int(side),
+        'sharpness': round(sharpness, 2),
+        'yaw': round(float(yaw), 4),
+        'roll': round(float(roll), 2),
+        'pose_score': round(pose_score, 4)
+    }
+
+def passes_quality(quality):
+    """Check a face quality record against the configured thresholds"""
+    return (
+        quality['size'] >= app.config['FACE_MIN_SIZE'] and
+        quality['sharpness'] >= app.config['FACE_MIN_SHARPNESS'] and
+        quality['yaw'] <= app.config['FACE_MAX_YAW'] and
+        quality['roll'] <= app.config['FACE_MAX_ROLL'] and
+        quality['score'] >= app.config['FACE_MIN_QUALITY']
+    )
+
+def extract_faces(img_array, confidence_threshold=0.8, quality_filter=True):
+    """Extract faces from image with error handling.
+
+    Returns face crops, positions and per-face quality records, ordered by
+    quality score. With quality_filter and FACE_QUALITY_MODE == 'skip',
+    faces failing the quality thresholds are dropped.
+    """
     if img_array is None or detector is None:
-        return [], []
+        return [], [], []
     
     try:
         rgb_img = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
         faces = detector.detect_faces(rgb_img)
-        face_images, face_positions = [], []
+        skip_low_quality = quality_filter and app.config['FACE_QUALITY_MODE'] == 'skip'
+        candidates = []
         
         for face in faces:
             if face['confidence'] >= confidence_threshold:
@@ -118,13 +200,19 @@ def extract_faces(img_array, confidence_threshold=0.8):
                 x1, y1, x2, y2 = max(0, x), max(0, y), min(rgb_img.shape[1], x + w), min(rgb_img.shape[0], y + h)
                 face_img = rgb_img[y1:y2, x1:x2]
                 if face_img.size > 0:
-                    face_images.append(face_img)
-                    face_positions.append((x1, y1, x2, y2))
+                    quality = assess_face_quality(rgb_img, (x1, y1, x2, y2), face.get('keypoints'))
+                    if skip_low_quality and not passes_quality(quality):
+                        continue
+                    candidates.append((face_img, (x1, y1, x2, y2), quality))
         
-        return face_images, face_positions
+        candidates.sort(key=lambda c: c[2]['score'], reverse=True)
+        face_images = [c[0] for c in candidates]
+        face_positions = [c[1] for c in candidates]
+        face_qualities = [c[2] for c in candidates]
+        return face_images, face_positions, face_qualities
     except Exception as e:
         print(f"Error extracting faces: {str(e)}")
-        return [], []
+        return [], [], []
 
 def extract_features(face_img):
     """Extract features from face image with error handling"""
@@ -270,16 +358,21 @@ def update_cache(username):
                 if img_array is None:
                     continue
                 
-                faces, positions = extract_faces(img_array)
+                faces, positions, qualities = extract_faces(img_array)
                 if not faces:
+                    # Record the hash with no faces so photos without usable
+                    # faces don't make check_album_changes trigger a rebuild
+                    if detector is not None:
+                        new_cache[img_path] = {'hash': file_hash, 'faces': []}
                     continue
                 
                 face_data = []
-                for face, position in zip(faces, positions):
+                for face, position, quality in zip(faces, positions, qualities):
                     features = extract_features(face)
                     face_data.append({
                         'embedding': features.tolist(),
-                        'position': position
+                        'position': position,
+                        'quality': quality
                     })
                 
                 new_cache[img_path] = {
@@ -304,10 +397,10 @@ def update_cache(username):
     finally:
         cache_updating = False
 
-def find_matches_in_album(username, solo_embedding, similarity_threshold=0.3):
-    """Find matching faces in album"""
+def find_matches_in_album(username, solo_embedding, similarity_threshold=0.3, min_quality=None):
+    """Find matching faces in album, optionally ignoring faces below min_quality"""
     try:
-        matches = []
+        ranked_matches = []
         cache = load_cache(username)
         
         for img_path, cache_entry in cache.items():
@@ -321,8 +414,14 @@ def find_matches_in_album(username, solo_embedding, similarity_threshold=0.3):
                 matched = False
                 best_similarity = 1.0
                 best_face_position = None
+                best_face_quality = None
                 
                 for face_data in cache_entry['faces']:
+                    # Entries indexed before quality scoring have no record and are kept
+                    quality = face_data.get('quality')
+                    if min_quality is not None and quality is not None and quality['score'] < min_quality:
+                        continue
+                    
                     features = np.array(face_data['embedding'])
                     position = face_data['position']
                     
@@ -331,6 +430,7 @@ def find_matches_in_album(username, solo_embedding, similarity_threshold=0.3):
                     if similarity < best_similarity:
                         best_similarity = similarity
                         best_face_position = position
+                        best_face_quality = quality
                     
                     if similarity < similarity_threshold:
                         matched = True
@@ -358,20 +458,28 @@ def find_matches_in_album(username, solo_embedding, similarity_threshold=0.3):
                     
                     safe_filename = urllib.parse.quote(os.path.basename(img_path))
                     
-                    matches.append({
+                    # Down-rank matches on low-quality faces; faces indexed
+                    # without a quality record are ranked on similarity alone
+                    quality_weight = app.config['FACE_QUALITY_WEIGHT']
+                    rank = similarity_percentage
+                    if best_face_quality:
+                        rank *= 1.0 - quality_weight + quality_weight * best_face_quality['score']
+                    
+                    ranked_matches.append((rank, {
                         "filename": safe_filename,
                         "filepath": img_path,
                         "similarity": similarity_percentage,
+                        "face_quality": best_face_quality['score'] if best_face_quality else None,
                         "image_data": f"data:image/jpeg;base64,{highlighted_b64}",
                         "original_image_data": f"data:image/jpeg;base64,{original_b64}"
-                    })
+                    }))
                     
             except Exception as e:
                 print(f"Error processing cached entry {img_path}: {str(e)}")
                 continue
         
-        matches.sort(key=lambda x: x["similarity"], reverse=True)
-        return matches
+        ranked_matches.sort(key=lambda x: x[0], reverse=True)
+        return [match for _, match in ranked_matches]
         
     except Exception as e:
         print(f"Error finding matches: {str(e)}")
@@ -505,6 +613,11 @@ def search():
     if 'solo_photo' not in request.files:
         return jsonify({"error": "Photo is required"}), 400
     
+    # Optional cut-off on stored face quality scores (0-1)
+    min_quality = request.form.get('min_quality', type=float)
+    if min_quality is not None and not (np.isfinite(min_quality) and 0.0 <= min_quality <= 1.0):
+        return jsonify({"error": "min_quality must be a number between 0 and 1"}), 400
+    
     try:
         username = session['username']
         cache = load_cache(username)
@@ -516,7 +629,8 @@ def search():
         solo_img_data = np.frombuffer(solo_photo.read(), np.uint8)
         solo_img_array = cv2.imdecode(solo_img_data, cv2.IMREAD_COLOR)
         
-        solo_faces, _ = extract_faces(solo_img_array)
+        # Don't reject the query face on quality; take the best-scoring one instead
+        solo_faces, _, _ = extract_faces(solo_img_array, quality_filter=False)
         if not solo_faces:
             return jsonify({
                 "match_found": False,
@@ -525,7 +639,7 @@ def search():
             })
         
         solo_embedding = extract_features(solo_faces[0])
-        matches = find_matches_in_album(username, solo_embedding, similarity_threshold=0.5)
+        matches = find_matches_in_album(username, solo_embedding, similarity_threshold=0.5, min_quality=min_quality)
         
         return app.response_class(
             response=json.dumps({